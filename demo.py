@@ -1,8 +1,108 @@
 import ast
+import builtins
 import subprocess
-import tempfile
 import re
-from typing import List, Dict
+from functools import lru_cache
+from typing import List, Dict, Optional, Set, Tuple
+
+_BUILTINS = frozenset(dir(builtins))
+_HEADER_PREFIXES = ('if ', 'elif ', 'for ', 'while ', 'def ', 'class ')
+_NEWLINE_RE = re.compile(r'(\r\n|\r|\n)')
+_BLOCK_RE = re.compile(r'^(\s*)(if|elif|for|while|def|class) .+:$')
+
+
+@lru_cache(maxsize=128)
+def _parse_cached(code: str) -> ast.Module:
+    """Parse code once and reuse the tree for identical source (do not mutate it)."""
+    return ast.parse(code)
+
+
+class _NameCollector(ast.NodeVisitor):
+    """Collect defined names (every binding form), loaded names and returned names in one pass."""
+
+    # Leaf nodes with nothing to collect; skipping them saves a dispatch each
+    _SKIP = (ast.expr_context, ast.operator, ast.boolop, ast.cmpop, ast.unaryop, ast.Constant)
+
+    def __init__(self):
+        self.defined_vars = set()
+        self.used_vars = set()
+        self.returned_names = []
+        # `from m import *` can bind any name, so no name can be called undefined
+        self.star_import = False
+
+    def _add_arguments(self, args):
+        for arg in args.posonlyargs + args.args + args.kwonlyargs + [args.vararg, args.kwarg]:
+            if arg is not None:
+                self.defined_vars.add(arg.arg)
+
+    def visit_FunctionDef(self, node):
+        self.defined_vars.add(node.name)
+        self._add_arguments(node.args)
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        self._add_arguments(node.args)
+        self.generic_visit(node)
+
+    def visit_ClassDef(self, node):
+        self.defined_vars.add(node.name)
+        self.generic_visit(node)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.name == '*':
+                self.star_import = True
+            else:
+                self.defined_vars.add(alias.asname or alias.name.split('.')[0])
+
+    visit_ImportFrom = visit_Import
+
+    def visit_ExceptHandler(self, node):
+        if node.name:
+            self.defined_vars.add(node.name)
+        self.generic_visit(node)
+
+    def visit_Global(self, node):
+        self.defined_vars.update(node.names)
+
+    visit_Nonlocal = visit_Global
+
+    def visit_MatchAs(self, node):
+        if node.name:
+            self.defined_vars.add(node.name)
+        self.generic_visit(node)
+
+    visit_MatchStar = visit_MatchAs
+
+    def visit_MatchMapping(self, node):
+        if node.rest:
+            self.defined_vars.add(node.rest)
+        self.generic_visit(node)
+
+    def visit_Return(self, node):
+        # A bare returned name is tracked on its own so it can be replaced rather than declared
+        if isinstance(node.value, ast.Name):
+            self.returned_names.append(node.value)
+        else:
+            self.generic_visit(node)
+
+    def visit_Name(self, node):
+        # Store covers assignment, loop, with, walrus and comprehension targets, unpacked or not
+        if isinstance(node.ctx, ast.Load):
+            self.used_vars.add(node.id)
+        elif isinstance(node.ctx, ast.Store):
+            self.defined_vars.add(node.id)
+
+    def generic_visit(self, node):
+        for _, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST) and not isinstance(item, self._SKIP):
+                        self.visit(item)
+            elif isinstance(value, ast.AST) and not isinstance(value, self._SKIP):
+                self.visit(value)
 
 
 class CodeAutoFixEngine:
@@ -12,123 +112,130 @@ class CodeAutoFixEngine:
 
     def auto_fix_syntax_errors(self):
         """Attempt to fix common syntax errors and missing colons."""
-        fixed_code = self.original_code
-
-        # Add missing colons at the end of if/elif/for/while/def/class statements
-        lines = fixed_code.split('\n')
-        corrected_lines = []
+        lines = self.original_code.split('\n')
+        new_lines = []
 
-        for line in lines:
+        for i, line in enumerate(lines):
+            # Add missing colons at the end of if/elif/for/while/def/class statements
             stripped = line.strip()
-            if re.match(r'^(if|elif|for|while|def|class) .*(?<!:)$', stripped):
-                corrected_lines.append(line + ':')
-            else:
-                corrected_lines.append(line)
+            if stripped.startswith(_HEADER_PREFIXES) and not stripped.endswith(':'):
+                line += ':'
 
-        fixed_code = '\n'.join(corrected_lines)
+            # Fix indentation (replace tabs with 4 spaces)
+            line = line.replace('\t', '    ')
+            new_lines.append(line)
 
-        # Fix indentation (replace tabs with 4 spaces)
-        fixed_code = re.sub(r'\t', '    ', fixed_code)
-
-        # Add missing pass for empty blocks
-        lines = fixed_code.split('\n')
-        new_lines = []
-        for i, line in enumerate(lines):
-            if re.match(r'^(\s*)(if|elif|for|while|def|class) .+:$', line):
-                if i + 1 >= len(lines) or lines[i + 1].strip() == '':
-                    new_lines.append(line)
-                    new_lines.append('    pass')
-                else:
-                    new_lines.append(line)
-            else:
-                new_lines.append(line)
+            # Add missing pass for empty blocks
+            if _BLOCK_RE.match(line) and (i + 1 >= len(lines) or lines[i + 1].strip() == ''):
+                new_lines.append('    pass')
 
         return '\n'.join(new_lines)
 
     def auto_format_with_black(self, code: str) -> str:
         """Auto-format the code using Black formatter if available."""
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".py") as temp_file:
-                temp_file.write(code.encode())
-                temp_file.flush()
-                temp_filename = temp_file.name
+            import black
+        except ImportError:  # Black is optional; fall back to the CLI if it is on PATH
+            black = None
 
-            subprocess.run(["black", temp_filename], capture_output=True, text=True)
+        try:
+            if black is not None:
+                return black.format_str(code, mode=black.Mode())
 
-            with open(temp_filename, 'r') as f:
-                formatted_code = f.read()
-            return formatted_code
+            result = subprocess.run(["black", "-q", "-"], input=code, capture_output=True, text=True)
+            if result.returncode != 0:
+                return code
+            return result.stdout
 
         except Exception:
             return code  # Fallback: return unformatted
 
-    def fix_undefined_variables(self, code: str) -> str:
-        """Automatically define undefined variables with default values (like x = 0)."""
+    def _analyze(self, code: str) -> Tuple[Set[str], List[ast.Name]]:
+        """Parse code once and find the names to declare and the returns to replace."""
+        collector = _NameCollector()
         try:
-            tree = ast.parse(code)
-            defined_vars = set()
-            used_vars = set()
-
-            for node in ast.walk(tree):
-                if isinstance(node, ast.Assign):
-                    for target in node.targets:
-                        if isinstance(target, ast.Name):
-                            defined_vars.add(target.id)
-                elif isinstance(node, ast.FunctionDef):
-                    for arg in node.args.args:
-                        defined_vars.add(arg.arg)
-                elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
-                    used_vars.add(node.id)
-
-            undefined_vars = used_vars - defined_vars - set(dir(__builtins__))
-
-            # Add undefined variables at the top of the code with default value 0
-            if undefined_vars:
-                declarations = ''.join(f'{var} = 0\n' for var in undefined_vars)
-                code = declarations + code
-
-            return code
+            collector.visit(_parse_cached(code))
         except Exception:
+            # Unparseable or too deeply nested (RecursionError): leave the code as is
+            return set(), []
+
+        defined_vars = collector.defined_vars | _BUILTINS
+        undefined_vars = collector.used_vars - defined_vars
+        # A name that still gets declared for its other uses is defined by the time it is returned
+        undefined_returns = [
+            name for name in collector.returned_names
+            if name.id not in defined_vars and name.id not in undefined_vars
+            # Module dunders such as __file__ exist at runtime without a binding
+            and not (name.id.startswith('__') and name.id.endswith('__'))
+        ]
+        if collector.star_import:
+            undefined_returns = []
+        return undefined_vars, undefined_returns
+
+    def fix_undefined_variables(self, code: str, undefined_vars: Optional[Set[str]] = None) -> str:
+        """Automatically define undefined variables with default values (like x = 0).
+
+        undefined_vars is the first item returned by _analyze(code); it is computed when omitted.
+        """
+        if undefined_vars is None:
+            undefined_vars, _ = self._analyze(code)
+        if not undefined_vars:
             return code
 
-    def fix_undefined_returns(self, code: str) -> str:
-        """Replace undefined return variables with 'None'."""
-        try:
-            tree = ast.parse(code)
-            defined_vars = set()
-
-            for node in ast.walk(tree):
-                if isinstance(node, ast.Assign):
-                    for target in node.targets:
-                        if isinstance(target, ast.Name):
-                            defined_vars.add(target.id)
-                elif isinstance(node, ast.FunctionDef):
-                    for arg in node.args.args:
-                        defined_vars.add(arg.arg)
-
-            lines = code.split('\n')
-            corrected_lines = []
-            for line in lines:
-                if line.strip().startswith('return '):
-                    return_var = line.strip().split()[1]
-                    if return_var not in defined_vars:
-                        line = f'return None'
-                corrected_lines.append(line)
-
-            return '\n'.join(corrected_lines)
-        except Exception:
+        # Add undefined variables at the top of the code with default value 0
+        declarations = ''.join(f'{var} = 0\n' for var in sorted(undefined_vars))
+        return declarations + code
+
+    def fix_undefined_returns(self, code: str, undefined_returns: Optional[List[ast.Name]] = None) -> str:
+        """Replace undefined return variables with 'None'.
+
+        undefined_returns is the second item returned by _analyze(code): the returned Name
+        nodes, whose positions must refer to this code. It is computed when omitted.
+        """
+        if undefined_returns is None:
+            _, undefined_returns = self._analyze(code)
+        if not undefined_returns:
             return code
+        return self._rewrite(code, undefined_returns, truncate=False)
 
     def fix_style_issues(self, code: str) -> str:
         """Trim overly long lines and simplify style errors."""
-        lines = code.split('\n')
-        corrected_lines = []
-        for line in lines:
-            if len(line) > 100:
-                corrected_lines.append(line[:100] + '  # truncated')
-            else:
-                corrected_lines.append(line)
-        return '\n'.join(corrected_lines)
+        return self._rewrite(code, [])
+
+    def _rewrite(self, code: str, undefined_returns: List[ast.Name], truncate: bool = True) -> str:
+        """Replace undefined returns and trim long lines in a single pass over the lines."""
+        # Split like the tokenizer (\r\n, \r or \n) so AST line numbers index correctly
+        parts = _NEWLINE_RE.split(code)
+        lines = parts[0::2]
+
+        returns_by_line = {}
+        for name in undefined_returns:
+            i = name.lineno - 1
+            # AST column offsets count UTF-8 bytes, not characters
+            if i >= len(lines) or lines[i].encode()[name.col_offset:name.end_col_offset] != name.id.encode():
+                returns_by_line = {}  # Position does not map onto this source; leave returns alone
+                break
+            returns_by_line.setdefault(i, []).append(name)
+
+        changed = False
+        for i, line in enumerate(lines):
+            names = returns_by_line.get(i)
+            if names:
+                encoded = line.encode()
+                # Right to left, so earlier offsets on the same line stay valid
+                for name in sorted(names, key=lambda n: n.col_offset, reverse=True):
+                    encoded = encoded[:name.col_offset] + b'None' + encoded[name.end_col_offset:]
+                line = encoded.decode()
+            if truncate and len(line) > 100:
+                line = line[:100] + '  # truncated'
+            if line is not lines[i]:
+                lines[i] = line
+                changed = True
+
+        if not changed:
+            return code
+        parts[0::2] = lines
+        return ''.join(parts)
 
     def auto_fix_code(self):
         """Run automatic fixes and show both faulty and corrected code."""
@@ -139,15 +246,13 @@ class CodeAutoFixEngine:
 
         print("\n🔧 Fixing syntax errors, missing lines, and indentation...")
         fixed_code = self.auto_fix_syntax_errors()
+        undefined_vars, undefined_returns = self._analyze(fixed_code)
 
-        print("🔄 Defining undefined variables...")
-        fixed_code = self.fix_undefined_variables(fixed_code)
+        print("🔄 Replacing undefined return values with 'None' and fixing style issues...")
+        fixed_code = self._rewrite(fixed_code, undefined_returns)
 
-        print("🔄 Replacing undefined return values with 'None'...")
-        fixed_code = self.fix_undefined_returns(fixed_code)
-
-        print("🎯 Fixing style issues...")
-        fixed_code = self.fix_style_issues(fixed_code)
+        print("🔄 Defining undefined variables...")
+        fixed_code = self.fix_undefined_variables(fixed_code, undefined_vars)
 
         print("✨ Formatting with Black (if available)...")
         fixed_code = self.auto_format_with_black(fixed_code)
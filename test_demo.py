@@ -0,0 +1,92 @@
+import unittest
+
+from demo import CodeAutoFixEngine
+
+
+# Valid code whose returned name is bound somewhere; the return must survive the fix.
+BOUND_RETURNS = {
+    'closure': "def deco(fn):\n    def inner(*a):\n        return fn(*a)\n    return inner\n",
+    'import': "import os\ndef f():\n    return os\n",
+    'import_as': "import os.path as osp\nfrom sys import argv as av\ndef f():\n    return osp, av\ndef g():\n    return av\n",
+    'vararg_kwarg': "def f(*args, **kwargs):\n    return kwargs\n",
+    'kwonly': "def f(a, *, key):\n    return key\n",
+    'posonly': "def f(a, /):\n    return a\n",
+    'async_def': "async def f(q):\n    return q\n",
+    'with': "def f(p):\n    with open(p) as fh:\n        return fh\n",
+    'except': "def f():\n    try:\n        pass\n    except ValueError as e:\n        return e\n",
+    'ann_assign': "def f():\n    x: int = 3\n    return x\n",
+    'aug_assign': "def f():\n    n += 1\n    return n\n",
+    'walrus': "def f(items):\n    if (n := len(items)) > 1:\n        return n\n",
+    'class': "class A:\n    pass\ndef make():\n    return A\n",
+    'tuple_for': "def f(x):\n    for i, j in x:\n        return j\n",
+    'comprehension': "def f(y):\n    return [z for z in y]\n",
+    'global': "def f():\n    global g\n    return g\n",
+    'nonlocal': "def f():\n    def g():\n        nonlocal v\n        return v\n    v = 1\n    return g\n",
+    'lambda': "f = lambda k: k\ndef g():\n    return f\n",
+    'match': "def f(p):\n    match p:\n        case [a, *rest]:\n            return rest\n        case {'k': v, **others}:\n            return others\n        case str() as s:\n            return s\n",
+    'dunder': "def f():\n    return __file__\n",
+    'star_import': "from os.path import *\ndef f():\n    return join\n",
+}
+
+
+class FixUndefinedReturnsTest(unittest.TestCase):
+    def test_bound_returns_are_kept(self):
+        engine = CodeAutoFixEngine('')
+        for label, code in BOUND_RETURNS.items():
+            with self.subTest(label):
+                _, undefined_returns = engine._analyze(code)
+                self.assertEqual([name.id for name in undefined_returns], [])
+                self.assertEqual(engine.fix_undefined_returns(code, undefined_returns), code)
+
+    def test_unbound_return_is_replaced(self):
+        engine = CodeAutoFixEngine('')
+        code = "def f(a):\n    return undefined_name  # explain\n"
+        undefined_vars, undefined_returns = engine._analyze(code)
+        self.assertEqual(undefined_vars, set())
+        self.assertEqual(
+            engine.fix_undefined_returns(code, undefined_returns),
+            "def f(a):\n    return None  # explain\n",
+        )
+
+    def test_carriage_return_line_breaks(self):
+        engine = CodeAutoFixEngine('')
+        for newline in ('\r', '\r\n'):
+            with self.subTest(newline=repr(newline)):
+                code = newline.join(['y = 1', 'def f():', '    return zz', ''])
+                _, undefined_returns = engine._analyze(code)
+                self.assertEqual(
+                    engine.fix_undefined_returns(code, undefined_returns),
+                    newline.join(['y = 1', 'def f():', '    return None', '']),
+                )
+
+    def test_unmappable_position_leaves_code_unchanged(self):
+        engine = CodeAutoFixEngine('')
+        _, undefined_returns = engine._analyze("def f():\n    pass\n\n\n    return zz\n")
+        self.assertEqual(engine.fix_undefined_returns('x = 1\n', undefined_returns), 'x = 1\n')
+
+    def test_analysis_is_computed_when_omitted(self):
+        engine = CodeAutoFixEngine('')
+        code = "def f(a):\n    print(q)\n    return zz\n"
+        self.assertEqual(engine.fix_undefined_returns(code), "def f(a):\n    print(q)\n    return None\n")
+        self.assertEqual(engine.fix_undefined_variables(code), "q = 0\n" + code)
+
+
+class FixStyleIssuesTest(unittest.TestCase):
+    def test_long_lines_are_truncated_and_short_code_is_untouched(self):
+        engine = CodeAutoFixEngine('')
+        code = 'x = 1\n' + 'y = "' + 'a' * 120 + '"\n'
+        self.assertEqual(engine.fix_style_issues(code), 'x = 1\n' + ('y = "' + 'a' * 120)[:100] + '  # truncated\n')
+        self.assertIs(engine.fix_style_issues('x = 1\n'), 'x = 1\n')
+
+    def test_return_splice_and_truncation_share_one_pass(self):
+        engine = CodeAutoFixEngine('')
+        code = 'def f():\n    return zz  # ' + 'c' * 120 + '\n'
+        _, undefined_returns = engine._analyze(code)
+        self.assertEqual(
+            engine._rewrite(code, undefined_returns),
+            'def f():\n' + ('    return None  # ' + 'c' * 120)[:100] + '  # truncated\n',
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()